@@ -1,3 +1,4 @@
+from pydantic import model_validator
 from pydantic_settings import BaseSettings, SettingsConfigDict
 from typing import Optional
 import secrets
@@ -8,10 +9,14 @@ class Settings(BaseSettings):
     API_V1_STR: str = "/api/v1"
     DEBUG: bool = False
     DATABASE_URL: str = "sqlite:///./sql_app.db"
-    # Generate a secure secret key if not provided
-    SECRET_KEY: str = secrets.token_urlsafe(32)
+    # Disable when the schema is managed offline (init_db script or migrations)
+    CREATE_TABLES_ON_STARTUP: bool = True
+    # Must be set in production so every worker signs tokens with the same key
+    SECRET_KEY: Optional[str] = None
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
     FAKE_API_BASE_URL: str = "https://api-onecloud.multicloud.tivit.com/fake"
+    # Optional CA bundle for an external API signed by a private CA
+    FAKE_API_CA_BUNDLE: Optional[str] = None
     
     model_config = SettingsConfigDict(
         env_file=".env",
@@ -19,4 +24,13 @@ class Settings(BaseSettings):
         case_sensitive=True
     )
 
+    @model_validator(mode="after")
+    def check_secret_key(self) -> "Settings":
+        if not self.SECRET_KEY:
+            if not self.DEBUG:
+                raise ValueError("SECRET_KEY must be set when DEBUG is disabled")
+            # Only acceptable for a single local process
+            self.SECRET_KEY = secrets.token_urlsafe(32)
+        return self
+
 settings = Settings()
@@ -1,6 +1,9 @@
 from datetime import datetime, timedelta
 from typing import Optional, Dict, Any
-from jose import JWTError, jwt
+import hashlib
+import time
+from cachetools import TTLCache
+import jwt
 from passlib.context import CryptContext
 from app.core.config import settings
 
@@ -9,6 +12,9 @@ pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 ALGORITHM = "HS256"
 
+# Decoded token payloads, keyed by a digest of the raw token
+_token_cache: TTLCache = TTLCache(maxsize=10000, ttl=30)
+
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
 
@@ -26,4 +32,21 @@ def create_access_token(data: Dict[str, Any], expires_delta: Optional[timedelta]
     return encoded_jwt
 
 def decode_access_token(token: str) -> Dict[str, Any]:
-    return jwt.decode(token, settings.SECRET_KEY, algorithms=[ALGORITHM])
+    key = hashlib.blake2b(token.encode(), digest_size=16).digest()
+    payload = _token_cache.get(key)
+    if payload is not None:
+        # A cached entry may outlive the token itself
+        exp = payload.get("exp")
+        if exp is None or exp > time.time():
+            return payload
+        _token_cache.pop(key, None)
+        raise jwt.ExpiredSignatureError("Signature has expired.")
+    payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[ALGORITHM])
+    _token_cache[key] = payload
+    return payload
+
+def warm_up() -> None:
+    # Load the JWT and bcrypt backends before the first request needs them
+    token = create_access_token({"sub": "_warmup_", "role": "user"}, timedelta(minutes=1))
+    decode_access_token(token)
+    get_password_hash("_warmup_")
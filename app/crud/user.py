@@ -1,12 +1,17 @@
+import asyncio
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from app.models.user import User
 from app.core.security import get_password_hash, verify_password
 
-def get_user(db: Session, username: str):
-    return db.query(User).filter(User.username == username).first()
+async def get_user(db: AsyncSession, username: str):
+    result = await db.execute(select(User).where(User.username == username))
+    return result.scalar_one_or_none()
 
-def get_users(db: Session, skip: int = 0, limit: int = 100):
-    return db.query(User).offset(skip).limit(limit).all()
+async def get_users(db: AsyncSession, skip: int = 0, limit: int = 100):
+    result = await db.execute(select(User).offset(skip).limit(limit))
+    return result.scalars().all()
 
 def create_user(db: Session, username: str, password: str, role: str):
     hashed_password = get_password_hash(password)
@@ -16,10 +21,15 @@ def create_user(db: Session, username: str, password: str, role: str):
     db.refresh(db_user)
     return db_user
 
-def authenticate_user(db: Session, username: str, password: str):
-    user = get_user(db, username)
+async def check_user_password(user: User, password: str) -> bool:
+    # bcrypt is CPU bound; run it off the event loop
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, verify_password, password, user.hashed_password)
+
+async def authenticate_user(db: AsyncSession, username: str, password: str):
+    user = await get_user(db, username)
     if not user:
         return None
-    if not verify_password(password, user.hashed_password):
+    if not await check_user_password(user, password):
         return None
     return user
@@ -1,12 +1,45 @@
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from app.core.config import settings
 
-SQLALCHEMY_DATABASE_URL = "sqlite:///./sql_app.db"
+SQLALCHEMY_DATABASE_URL = settings.DATABASE_URL
 
+def get_async_database_url(url: str) -> str:
+    # Map plain driver URLs onto their asyncio drivers
+    if url.startswith("sqlite://"):
+        return url.replace("sqlite://", "sqlite+aiosqlite://", 1)
+    if url.startswith("postgresql://"):
+        return url.replace("postgresql://", "postgresql+asyncpg://", 1)
+    return url
+
+is_sqlite = SQLALCHEMY_DATABASE_URL.startswith("sqlite")
+
+connect_args = {"check_same_thread": False} if is_sqlite else {}
+
+# SQLite engines don't use QueuePool (aiosqlite gets NullPool), so only size real pools
+pool_args = {} if is_sqlite else {"pool_size": 20, "max_overflow": 30, "pool_timeout": 30}
+
+# Sync engine, used for schema creation and the init_db script
 engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
+    SQLALCHEMY_DATABASE_URL,
+    pool_pre_ping=True,
+    pool_recycle=1800,
+    connect_args=connect_args,
+    **pool_args
+)
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False, bind=engine)
+
+# Async engine, used by the API request handlers
+async_engine = create_async_engine(
+    get_async_database_url(SQLALCHEMY_DATABASE_URL),
+    pool_pre_ping=True,
+    pool_recycle=1800,
+    **pool_args
+)
+AsyncSessionLocal = async_sessionmaker(
+    async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False
 )
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
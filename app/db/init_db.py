@@ -1,36 +1,85 @@
+import os
+import tempfile
+from sqlalchemy import inspect, text
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.orm import Session
-from app.crud.user import create_user
+from app.core.security import get_password_hash
 from app.db.base import SessionLocal, Base, engine
 from app.models.user import User
 
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
 # Initial test users
 INITIAL_USERS = [
     {"username": "user", "password": "L0XuwPOdS5U", "role": "user"},
     {"username": "admin", "password": "JKSipm0YH", "role": "admin"},
 ]
 
+# Dialects whose insert() supports ON CONFLICT DO NOTHING
+INSERT_BY_DIALECT = {
+    "postgresql": postgresql.insert,
+    "sqlite": sqlite.insert,
+}
+
+# Serializes schema creation across worker processes on the same host
+INIT_LOCK_PATH = os.path.join(tempfile.gettempdir(), "app-init.lock")
+
+# Returns False when the schema already exists, e.g. another worker created it
+def create_tables() -> bool:
+    with open(INIT_LOCK_PATH, "w") as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            # One table-list query instead of create_all's per-table checks and DDL
+            existing = set(inspect(engine).get_table_names())
+            if set(Base.metadata.tables) <= existing:
+                return False
+            Base.metadata.create_all(bind=engine)
+            return True
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
 def init_db(db: Session) -> None:
     # Create tables
-    Base.metadata.create_all(bind=engine)
+    create_tables()
     
-    # Check if we already have users
-    user = db.query(User).first()
-    if user is not None:
+    rows = [
+        {
+            "username": user_data["username"],
+            "hashed_password": get_password_hash(user_data["password"]),
+            "role": user_data["role"]
+        }
+        for user_data in INITIAL_USERS
+    ]
+    
+    insert = INSERT_BY_DIALECT.get(engine.dialect.name)
+    with db.begin():
+        if insert is not None:
+            # Existing usernames are skipped, so re-running needs no probe query
+            result = db.execute(
+                insert(User).values(rows).on_conflict_do_nothing(index_elements=["username"])
+            )
+            created = result.rowcount
+        else:
+            # Check if we already have users, without loading any into the session
+            if db.execute(text("SELECT 1 FROM users LIMIT 1")).first() is not None:
+                created = 0
+            else:
+                db.bulk_save_objects([User(**row) for row in rows])
+                created = len(rows)
+    
+    if not created:
         print("Database already initialized")
         return
-
-    for user_data in INITIAL_USERS:
-        user = create_user(
-            db=db,
-            username=user_data["username"],
-            password=user_data["password"],
-            role=user_data["role"]
-        )
-        print(f"Created user: {user.username} with role: {user.role}")
+    print(f"Created {created} initial users")
 
 def main() -> None:
-    db = SessionLocal()
-    init_db(db)
+    with SessionLocal() as db:
+        init_db(db)
 
 if __name__ == "__main__":
     main()
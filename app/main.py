@@ -1,29 +1,70 @@
-from fastapi import FastAPI, Depends, HTTPException, status
+from fastapi import FastAPI, Depends, HTTPException, Request, status
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from contextlib import asynccontextmanager
 from datetime import timedelta
+from typing import Any, Optional, Tuple
+from cachetools import TTLCache
+import asyncio
 import httpx
-from jose import JWTError
-from pydantic import BaseModel
+from jwt import InvalidTokenError
+from pydantic import BaseModel, ValidationError
+from starlette.background import BackgroundTask
 import logging
+import ssl
+import time
 
 from app.core.config import settings
-from app.core.security import create_access_token, decode_access_token, ALGORITHM
+from app.core.security import create_access_token, decode_access_token, warm_up, ALGORITHM
 from app.schemas.token import Token, TokenData
-from app.db.base import SessionLocal, engine
-from app.models.user import Base, User
-from app.crud.user import authenticate_user, get_user
+from app.db.base import AsyncSessionLocal, async_engine
+from app.db.init_db import create_tables
+from app.models.user import User
+from app.crud.user import check_user_password, get_user
 
 # Configure logging
-logging.basicConfig(level=logging.DEBUG)
+logging.basicConfig(level=logging.DEBUG if settings.DEBUG else logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Create database tables
-Base.metadata.create_all(bind=engine)
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Create missing tables (only the first worker finds any) and warm up crypto, off the event loop
+    loop = asyncio.get_running_loop()
+    if settings.CREATE_TABLES_ON_STARTUP:
+        await loop.run_in_executor(None, create_tables)
+    await loop.run_in_executor(None, warm_up)
+    
+    # Verify upstream certificates, against a private CA bundle when one is configured
+    verify = (
+        ssl.create_default_context(cafile=settings.FAKE_API_CA_BUNDLE)
+        if settings.FAKE_API_CA_BUNDLE
+        else True
+    )
+    # Shared HTTP client so calls to the external API reuse pooled keep-alive connections
+    app.state.client = httpx.AsyncClient(
+        base_url=settings.FAKE_API_BASE_URL,
+        verify=verify,
+        timeout=30.0,
+        http2=True,
+        # HTTP/2 multiplexes requests as streams, so few connections are needed
+        limits=httpx.Limits(
+            max_connections=100,
+            max_keepalive_connections=10,
+            keepalive_expiry=30.0
+        )
+    )
+    try:
+        yield
+    finally:
+        await app.state.client.aclose()
+        await async_engine.dispose()
 
 app = FastAPI(
     title=settings.PROJECT_NAME,
     version=settings.VERSION,
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse,
     description="API with JWT authentication using JSON format",
     openapi_tags=[
         {
@@ -47,62 +88,108 @@ app = FastAPI(
 
 security = HTTPBearer()
 
+ACCESS_TOKEN_EXPIRE = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
+BEARER_AUTH_HEADERS = {"WWW-Authenticate": "Bearer"}
+
+CREDENTIALS_DETAIL = "Could not validate credentials"
+LOGIN_DETAIL = "Incorrect username or password"
+FORBIDDEN_DETAIL = "Not enough permissions"
+EXTERNAL_TOKEN_DETAIL = "External token not found"
+INACTIVE_USER_DETAIL = "Inactive user"
+
+# Built per raise: a shared instance would carry __context__ across requests
+def _credentials_exception() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail=CREDENTIALS_DETAIL,
+        headers=BEARER_AUTH_HEADERS,
+    )
+
+# Authenticated users as (id, role, is_active), keyed by username.
+# Pop the entry from any CRUD that changes a user's role or active state.
+_user_cache: "TTLCache[str, Tuple[int, str, bool]]" = TTLCache(maxsize=5000, ttl=60)
+
+# Last successful upstream health response as (monotonic timestamp, body)
+HEALTH_CACHE_SECONDS = 5
+_health_cache: Optional[Tuple[float, Any]] = None
+
 class LoginData(BaseModel):
     username: str
     password: str
 
 # Dependency
-def get_db():
-    db = SessionLocal()
-    try:
+async def get_db():
+    async with AsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
+
+def get_http_client(request: Request) -> httpx.AsyncClient:
+    return request.app.state.client
+
+async def stream_upstream(client: httpx.AsyncClient, path: str, headers: dict) -> StreamingResponse:
+    # Pipe the upstream body through chunk by chunk instead of decoding and re-encoding it
+    request = client.build_request("GET", path, headers=headers)
+    response = await client.send(request, stream=True)
+    passthrough_headers = {"content-type": response.headers.get("content-type", "application/json")}
+    # Raw chunks are still compressed, so the client needs the original encoding
+    if "content-encoding" in response.headers:
+        passthrough_headers["content-encoding"] = response.headers["content-encoding"]
+    return StreamingResponse(
+        response.aiter_raw(),
+        status_code=response.status_code,
+        headers=passthrough_headers,
+        background=BackgroundTask(response.aclose)
+    )
+
+async def get_token_payload(
+    credentials: HTTPAuthorizationCredentials = Depends(security)
+):
+    try:
+        # Never log the token or payload: both carry the bearer JWT and ext_token secrets
+        return decode_access_token(credentials.credentials)
+    except InvalidTokenError as e:
+        logger.error("JWT Error: %s", e)
+        raise _credentials_exception()
 
 async def get_current_user(
-    credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: Session = Depends(get_db)
+    payload: dict = Depends(get_token_payload),
+    db: AsyncSession = Depends(get_db)
 ):
-    credentials_exception = HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="Could not validate credentials",
-        headers={"WWW-Authenticate": "Bearer"},
-    )
+    username: str = payload.get("sub")
+    role: str = payload.get("role")
+    logger.debug("Extracted username: %s, role: %s", username, role)
+    
+    if username is None or role is None:
+        logger.error("Username or role is None")
+        raise _credentials_exception()
+    
     try:
-        token = credentials.credentials
-        logger.debug(f"Received token: {token}")
-        
-        payload = decode_access_token(token)
-        logger.debug(f"Decoded payload: {payload}")
-        
-        username: str = payload.get("sub")
-        role: str = payload.get("role")
-        logger.debug(f"Extracted username: {username}, role: {role}")
-        
-        if username is None or role is None:
-            logger.error("Username or role is None")
-            raise credentials_exception
-            
         token_data = TokenData(username=username, role=role)
-        logger.debug(f"Created token data: {token_data}")
-        
-    except JWTError as e:
-        logger.error(f"JWT Error: {str(e)}")
-        raise credentials_exception
-    except Exception as e:
-        logger.error(f"Unexpected error: {str(e)}")
-        raise credentials_exception
+    except ValidationError as e:
+        logger.error("Invalid token claims: %s", e)
+        raise _credentials_exception()
+    logger.debug("Created token data: %s", token_data)
     
-    user = get_user(db, username=token_data.username)
-    logger.debug(f"Retrieved user: {user}")
+    cached = _user_cache.get(token_data.username)
+    if cached is not None:
+        user_id, user_role, user_is_active = cached
+        user = User(
+            id=user_id,
+            username=token_data.username,
+            role=user_role,
+            is_active=user_is_active
+        )
+    else:
+        user = await get_user(db, username=token_data.username)
+        if user is not None:
+            _user_cache[token_data.username] = (user.id, user.role, user.is_active)
     
     if user is None:
         logger.error("User not found in database")
-        raise credentials_exception
+        raise _credentials_exception()
         
     if user.role != token_data.role:
-        logger.error(f"Role mismatch: token role {token_data.role} != user role {user.role}")
-        raise credentials_exception
+        logger.error("Role mismatch: token role %s != user role %s", token_data.role, user.role)
+        raise _credentials_exception()
         
     return user
 
@@ -110,62 +197,83 @@ async def get_current_active_user(
     current_user: User = Depends(get_current_user)
 ):
     if not current_user.is_active:
-        raise HTTPException(status_code=400, detail="Inactive user")
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=INACTIVE_USER_DETAIL
+        )
     return current_user
 
 @app.post("/token", response_model=Token, tags=["authentication"])
 async def login_for_access_token(
     login_data: LoginData,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db),
+    client: httpx.AsyncClient = Depends(get_http_client)
 ):
-    user = authenticate_user(db, login_data.username, login_data.password)
-    if not user:
+    # Unknown usernames are rejected before anything is sent upstream
+    user = await get_user(db, username=login_data.username)
+    if user is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Incorrect username or password",
-            headers={"WWW-Authenticate": "Bearer"},
+            detail=LOGIN_DETAIL,
+            headers=BEARER_AUTH_HEADERS,
+        )
+    
+    # Log request details, never the password
+    logger.debug("Sending request to external API for username=%s", login_data.username)
+    
+    # Send credentials as a form body so they never appear in the URL
+    form_data = {
+        "username": login_data.username,
+        "password": login_data.password
+    }
+    # Start the external token request so it overlaps with the bcrypt check
+    external_request = asyncio.create_task(
+        client.post(
+            "/token",
+            data=form_data
         )
+    )
     
-    # Get token from external API first
+    password_ok = False
     try:
-        async with httpx.AsyncClient(verify=False) as client:
-            # Log request details
-            logger.debug(f"Sending request to external API with params: username={login_data.username}, password={login_data.password}")
-            
-            # Use query parameters instead of JSON body
-            params = {
-                "username": login_data.username,
-                "password": login_data.password
-            }
-            response = await client.post(
-                f"{settings.FAKE_API_BASE_URL}/token",
-                params=params  # Send as query parameters
-            )
-            
-            # Log response details
-            logger.debug(f"External API response status: {response.status_code}")
-            logger.debug(f"External API response body: {response.text}")
-            
-            if response.status_code != 200:
-                raise HTTPException(
-                    status_code=response.status_code,
-                    detail=f"{response.status_code}: {response.text}"
-                )
-            external_token = response.json()["access_token"]
-            
-            # Create our own token that includes both our user info and the external token
-            access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
-            access_token = create_access_token(
-                data={
-                    "sub": user.username,
-                    "role": user.role,
-                    "ext_token": external_token
-                },
-                expires_delta=access_token_expires
+        password_ok = await check_user_password(user, login_data.password)
+    finally:
+        if not password_ok:
+            external_request.cancel()
+    if not password_ok:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail=LOGIN_DETAIL,
+            headers=BEARER_AUTH_HEADERS,
+        )
+    
+    # Collect the external token once the credentials are verified
+    try:
+        response = await external_request
+        
+        # Log response details
+        logger.debug("External API response status: %s", response.status_code)
+        
+        if response.status_code != 200:
+            raise HTTPException(
+                status_code=response.status_code,
+                detail=f"{response.status_code}: {response.text}"
             )
-            return {"access_token": access_token, "token_type": "bearer", "role": user.role}
-    except Exception as e:
-        logger.error(f"Error during token generation: {str(e)}")
+        external_token = response.json()["access_token"]
+        
+        # Create our own token that includes both our user info and the external token
+        access_token = create_access_token(
+            data={
+                "sub": user.username,
+                "role": user.role,
+                "ext_token": external_token
+            },
+            expires_delta=ACCESS_TOKEN_EXPIRE
+        )
+        return {"access_token": access_token, "token_type": "bearer", "role": user.role}
+    except (httpx.HTTPError, ValueError, KeyError) as e:
+        # HTTPException from a non-200 upstream response propagates unchanged
+        logger.exception("Error during token generation")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=str(e)
@@ -174,28 +282,27 @@ async def login_for_access_token(
 @app.get("/user", tags=["user"])
 async def read_user_route(
     current_user: User = Depends(get_current_active_user),
-    credentials: HTTPAuthorizationCredentials = Depends(security)
+    payload: dict = Depends(get_token_payload),
+    client: httpx.AsyncClient = Depends(get_http_client)
 ):
     if current_user.role not in ["user", "admin"]:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
-            detail="Not enough permissions"
+            detail=FORBIDDEN_DETAIL
+        )
+    # Get the external token from our JWT payload
+    external_token = payload.get("ext_token")
+    if not external_token:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail=EXTERNAL_TOKEN_DETAIL
         )
+    
+    headers = {"Authorization": f"Bearer {external_token}"}
     try:
-        # Get the external token from our JWT payload
-        payload = decode_access_token(credentials.credentials)
-        external_token = payload.get("ext_token")
-        if not external_token:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="External token not found"
-            )
-            
-        async with httpx.AsyncClient(verify=False) as client:
-            headers = {"Authorization": f"Bearer {external_token}"}
-            response = await client.get(f"{settings.FAKE_API_BASE_URL}/user", headers=headers)
-            return response.json()
-    except Exception as e:
+        return await stream_upstream(client, "/user", headers)
+    except httpx.HTTPError as e:
+        logger.exception("Error fetching /user from external API")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=str(e)
@@ -204,40 +311,45 @@ async def read_user_route(
 @app.get("/admin", tags=["admin"])
 async def read_admin_route(
     current_user: User = Depends(get_current_active_user),
-    credentials: HTTPAuthorizationCredentials = Depends(security)
+    payload: dict = Depends(get_token_payload),
+    client: httpx.AsyncClient = Depends(get_http_client)
 ):
     if current_user.role != "admin":
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
-            detail="Not enough permissions"
+            detail=FORBIDDEN_DETAIL
+        )
+    # Get the external token from our JWT payload
+    external_token = payload.get("ext_token")
+    if not external_token:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail=EXTERNAL_TOKEN_DETAIL
         )
+    
+    headers = {"Authorization": f"Bearer {external_token}"}
     try:
-        # Get the external token from our JWT payload
-        payload = decode_access_token(credentials.credentials)
-        external_token = payload.get("ext_token")
-        if not external_token:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="External token not found"
-            )
-            
-        async with httpx.AsyncClient(verify=False) as client:
-            headers = {"Authorization": f"Bearer {external_token}"}
-            response = await client.get(f"{settings.FAKE_API_BASE_URL}/admin", headers=headers)
-            return response.json()
-    except Exception as e:
+        return await stream_upstream(client, "/admin", headers)
+    except httpx.HTTPError as e:
+        logger.exception("Error fetching /admin from external API")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=str(e)
         )
 
 @app.get("/health", tags=["health"])
-async def health_check():
+async def health_check(client: httpx.AsyncClient = Depends(get_http_client)):
+    global _health_cache
+    if _health_cache is not None and time.monotonic() - _health_cache[0] < HEALTH_CACHE_SECONDS:
+        return _health_cache[1]
     try:
-        async with httpx.AsyncClient(verify=False) as client:
-            response = await client.get(f"{settings.FAKE_API_BASE_URL}/health")
-            return response.json()
-    except Exception as e:
+        response = await client.get("/health")
+        body = response.json()
+        if response.is_success:
+            _health_cache = (time.monotonic(), body)
+        return body
+    except (httpx.HTTPError, ValueError) as e:
+        logger.exception("Error checking external API health")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=str(e)